@@ -1,7 +1,12 @@
+import bisect
 import json
+import math
+import re
+from contextlib import contextmanager
 from typing import ClassVar, Generic, Iterator, Protocol, TypeVar, cast, overload
 
 import h5py
+import numpy as np
 from hdf5_dataclass import FileType
 
 from endgame_simulations.models import BaseInitialParams, EndgameModel
@@ -9,6 +14,15 @@ from endgame_simulations.simulations import GenericSimulation
 
 from .common import State
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+# A run of digits at least as long as the smallest int that orjson can't read exactly.
+# Floats are written with at most 17 significant digits, so they never match.
+_LONG_DIGITS = re.compile(rb"\d{19}")
+
 CombinedParams = TypeVar("CombinedParams", bound=BaseInitialParams)
 EndgameModelGeneric = TypeVar(
     "EndgameModelGeneric", bound=EndgameModel, contravariant=True
@@ -23,7 +37,8 @@ def find_next_params_index(
     supposed to be used, determines the index of the parameter set to be used next.
 
     Args:
-        param_set (list[tuple[float, CombinedParams]]): A list where each item represents:
+        param_set (list[tuple[float, CombinedParams]]): A list, sorted by time, where each
+            item represents:
             float: Time the parameters should be changed.
             CombinedParams: The new parameters at that time
         current_time (float): The current time of the simulation.
@@ -31,17 +46,176 @@ def find_next_params_index(
     Returns:
         int: The index (based on the list provided) of the relevant item.
     """
-    try:
-        next_params_index = next(
-            i for i, (time, _) in enumerate(param_set) if time > current_time
-        )
-    except StopIteration:
-        return len(param_set)
+    next_params_index = bisect.bisect_right(
+        param_set, current_time, key=lambda item: item[0]
+    )
     if next_params_index < 1:
         raise ValueError(f"Invalid next param index: {next_params_index}")
     return next_params_index
 
 
+@contextmanager
+def _open_h5(
+    file: FileType | h5py.File | h5py.Group, mode: str
+) -> Iterator[h5py.File | h5py.Group]:
+    """
+    Open `file` as HDF5 for the duration of the context. An already open file/group is
+    used as is, and left open on exit.
+
+    Args:
+        file (FileType | h5py.File | h5py.Group): The file/stream/group.
+        mode (str): The mode to open the file with, e.g. "r" or "w".
+
+    Yields:
+        Iterator[h5py.File | h5py.Group]: The open file/group.
+    """
+    if isinstance(file, (h5py.File, h5py.Group)):
+        yield file
+    else:
+        with h5py.File(file, mode) as h5:
+            yield h5
+
+
+def _is_finite(value) -> bool:
+    """
+    Whether every float in `value`, searching through dicts, lists and tuples, is finite.
+
+    Args:
+        value: The value to check, e.g. the output of `params.dict()`.
+
+    Returns:
+        bool: False if any float is NaN or infinite.
+    """
+    if isinstance(value, float):
+        return math.isfinite(value)
+    if isinstance(value, dict):
+        return all(_is_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return all(_is_finite(item) for item in value)
+    return True
+
+
+def _params_to_json(params: BaseInitialParams) -> bytes:
+    """
+    JSON encode `params`, as `params.json()` does, but with orjson if it is installed.
+
+    Args:
+        params (BaseInitialParams): The parameters to encode.
+
+    Returns:
+        bytes: The JSON encoded parameters.
+    """
+    if orjson is not None:
+        params_dict = params.dict()
+        # orjson writes NaN and infinity as null, so those are left to the standard
+        # library, which keeps them
+        if _is_finite(params_dict):
+            try:
+                return orjson.dumps(
+                    params_dict,
+                    default=params.__json_encoder__,
+                    option=orjson.OPT_NON_STR_KEYS,
+                )
+            except TypeError:
+                # e.g. an int beyond 64 bits, which only the standard library handles
+                pass
+    return params.json().encode()
+
+
+def _json_loads(data: str | bytes):
+    """
+    Decode JSON, with orjson if it is installed.
+
+    Args:
+        data (str | bytes): The JSON to decode.
+
+    Returns:
+        The decoded object.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    # orjson reads ints beyond 64 bits as floats, losing precision, so anything with a
+    # run of digits that long is left to the standard library
+    if orjson is not None and _LONG_DIGITS.search(data) is None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # e.g. NaN or Infinity, which the standard library writes but orjson rejects
+            pass
+    return json.loads(data)
+
+
+def _encode_param_set(
+    param_set: list[tuple[float, CombinedParams]]
+) -> list[tuple[float, bytes]]:
+    """
+    Encode each item of a parameter set as JSON, ready for `_write_param_set`.
+
+    Args:
+        param_set (list[tuple[float, CombinedParams]]): The parameter set to encode.
+
+    Returns:
+        list[tuple[float, bytes]]: The time and JSON encoded parameters of each item.
+    """
+    return [(time, _params_to_json(params)) for time, params in param_set]
+
+
+def _write_param_set(
+    h5: h5py.File | h5py.Group,
+    encoded_param_set: list[tuple[float, bytes]],
+) -> None:
+    """
+    Write a parameter set into `h5`, as a "param_sets" group holding two datasets: "times",
+    the time of each item, and "params", the JSON of each item's parameters.
+
+    Args:
+        h5 (h5py.File | h5py.Group): The file/group to write into.
+        encoded_param_set (list[tuple[float, bytes]]): The parameter set to write, as
+            encoded by `_encode_param_set`.
+    """
+    grp = h5.create_group("param_sets")
+    grp.create_dataset(
+        "times",
+        data=np.array([time for time, _ in encoded_param_set], dtype=np.float64),
+    )
+    grp.create_dataset(
+        "params",
+        data=[params_json for _, params_json in encoded_param_set],
+        dtype=h5py.string_dtype(),
+    )
+
+
+def _read_param_set(
+    h5: h5py.File | h5py.Group, params_model: type[CombinedParams]
+) -> list[tuple[float, CombinedParams]]:
+    """
+    Read a parameter set written by `_write_param_set` from `h5`. Files from older versions,
+    which hold the whole parameter set as a single JSON attribute, are also supported.
+
+    Args:
+        h5 (h5py.File | h5py.Group): The file/group to read from.
+        params_model (type[CombinedParams]): The model used to parse each parameter set.
+
+    Returns:
+        list[tuple[float, CombinedParams]]: The parameter set.
+    """
+    if "param_sets" not in h5:
+        param_set_str = h5.attrs["param_set"]
+        assert isinstance(param_set_str, str)
+        return [
+            (time, params_model.parse_obj(params))
+            for time, params in _json_loads(param_set_str)
+        ]
+
+    times = h5["param_sets/times"]
+    params_data = h5["param_sets/params"]
+    assert isinstance(times, h5py.Dataset) and isinstance(params_data, h5py.Dataset)
+    return [
+        (time, params_model.parse_obj(_json_loads(params_json)))
+        for time, params_json in zip(times[()].tolist(), params_data[()])
+    ]
+
+
 class ConvertEndgame(Protocol, Generic[EndgameModelGeneric, CombinedParams]):
     """
     The structure protocol of the convert endgame function to be provided to
@@ -56,18 +230,33 @@ class ConvertEndgame(Protocol, Generic[EndgameModelGeneric, CombinedParams]):
 
 Simulation = TypeVar("Simulation", bound=GenericSimulation)
 
+# Converted parameter sets, keyed by endgame class, endgame model class and the endgame's
+# JSON, so that the same endgame isn't converted (and validated) again for every
+# simulation. The oldest entry is dropped once the cache is full.
+_CONVERTED_ENDGAME_CACHE_SIZE = 128
+_converted_endgames: dict[
+    tuple[type, type[EndgameModel], str], list[tuple[float, BaseInitialParams]]
+] = {}
+
 
 class GenericEndgame(Generic[EndgameModelGeneric, Simulation, State, CombinedParams]):
     """
     The Base class for all endgame simulation classes. These represent basic simulations, that are
     simply advanced in time.
+
+    Instance attributes are stored in slots. Subclasses that add none of their own can
+    declare `__slots__ = ()` to drop the instance `__dict__` entirely.
     """
 
+    __slots__ = ("simulation", "_param_set", "_param_set_json", "next_params_index")
+
     simulation_class: ClassVar[type[GenericSimulation]]
     combined_params_model: ClassVar[type[BaseInitialParams]]
     convert_endgame: ClassVar[ConvertEndgame]
     simulation: Simulation
     _param_set: list[tuple[float, CombinedParams]]
+    # the encoded `_param_set`, kept between saves; None until first needed
+    _param_set_json: list[tuple[float, bytes]] | None
     next_params_index: int
 
     def __init_subclass__(
@@ -145,7 +334,7 @@ class GenericEndgame(Generic[EndgameModelGeneric, Simulation, State, CombinedPar
         ), "You must provide either `endgame` or `input`"
 
         if endgame:
-            self._param_set = type(self).convert_endgame(endgame)
+            self._param_set = self._convert_endgame(endgame)
             assert start_time is not None and (len(self._param_set) > 0)
             self.next_params_index = find_next_params_index(self._param_set, start_time)
             simulation = type(self).simulation_class(
@@ -157,37 +346,51 @@ class GenericEndgame(Generic[EndgameModelGeneric, Simulation, State, CombinedPar
 
         else:
             assert input
-            if isinstance(input, (h5py.File, h5py.Group)):
-                h5 = input
+            with _open_h5(input, "r") as h5:
                 sim = h5["simulation"]
-                param_set_str = h5.attrs["param_set"]
+                param_set = _read_param_set(h5, self.combined_params_model)
                 next_params = h5.attrs["next_params_index"]
                 assert isinstance(sim, h5py.Group)
                 simulation = type(self).simulation_class.restore(input=sim)
-            else:
-                with h5py.File(input, "r") as h5:
-                    sim = h5["simulation"]
-                    param_set_str = h5.attrs["param_set"]
-                    next_params = h5.attrs["next_params_index"]
-                    assert isinstance(sim, h5py.Group)
-                    simulation = type(self).simulation_class.restore(input=sim)
-
-            assert isinstance(param_set_str, str)
-            param_set: list[tuple[float, dict]] = json.loads(param_set_str)
-            converted_param_set = [
-                (i[0], self.combined_params_model.parse_obj(i[1])) for i in param_set
-            ]
-            self._param_set = cast(
-                list[tuple[float, CombinedParams]], converted_param_set
-            )
+
+            self._param_set = cast(list[tuple[float, CombinedParams]], param_set)
 
             assert not isinstance(next_params, h5py.Empty)
             self.next_params_index = int(next_params)
 
+        self._param_set_json = None
         self.simulation = cast(Simulation, simulation)
 
+    def _convert_endgame(
+        self, endgame: EndgameModelGeneric
+    ) -> list[tuple[float, CombinedParams]]:
+        """
+        Convert the endgame with `convert_endgame`, reusing the result if an identical
+        endgame has been converted before.
+
+        Args:
+            endgame (EndgameModelGeneric): The endgame model description.
+
+        Returns:
+            list[tuple[float, CombinedParams]]: The parameter set. The list and the
+                parameter models in it (nested models included) are copies, so can be
+                changed freely.
+        """
+        key = (type(self), type(endgame), endgame.json())
+        param_set = _converted_endgames.get(key)
+        if param_set is None:
+            param_set = type(self).convert_endgame(endgame)
+            if len(_converted_endgames) >= _CONVERTED_ENDGAME_CACHE_SIZE:
+                del _converted_endgames[next(iter(_converted_endgames))]
+            _converted_endgames[key] = param_set
+        return [
+            (time, cast(CombinedParams, params.copy(deep=True)))
+            for time, params in param_set
+        ]
+
     def reset_endgame(self, endgame: EndgameModelGeneric):
-        self._param_set = type(self).convert_endgame(endgame)
+        self._param_set = self._convert_endgame(endgame)
+        self._param_set_json = None
         assert len(self._param_set) > 0
         self.next_params_index = find_next_params_index(
             self._param_set, self.simulation.state.current_time
@@ -205,22 +408,14 @@ class GenericEndgame(Generic[EndgameModelGeneric, Simulation, State, CombinedPar
         Args:
             output (FileType): output file/stream
         """
-        if isinstance(output, (h5py.File, h5py.Group)):
-            h5 = output
+        if self._param_set_json is None:
+            self._param_set_json = _encode_param_set(self._param_set)
+
+        with _open_h5(output, "w") as h5:
             grp = h5.create_group("simulation")
             self.simulation.save(grp)
-            h5.attrs["param_set"] = json.dumps(
-                [(i[0], i[1].dict()) for i in self._param_set]
-            )
+            _write_param_set(h5, self._param_set_json)
             h5.attrs["next_params_index"] = self.next_params_index
-        else:
-            with h5py.File(output, "w") as h5:
-                grp = h5.create_group("simulation")
-                self.simulation.save(grp)
-                h5.attrs["param_set"] = json.dumps(
-                    [(i[0], i[1].dict()) for i in self._param_set]
-                )
-                h5.attrs["next_params_index"] = self.next_params_index
 
     @classmethod
     def restore(cls, input: FileType | h5py.File | h5py.Group):
@@ -293,34 +488,48 @@ class GenericEndgame(Generic[EndgameModelGeneric, Simulation, State, CombinedPar
         sampling_interval: float | None = None,
         sampling_years: list[float] | None = None,
         inclusive: bool = False,
-        make_time_backwards_compatible = False,
+        make_time_backwards_compatible=False,
     ) -> Iterator[State]:
+        simulation = self.simulation
+        param_set = self._param_set
         # if using an old version of the model, we need to set `make_time_backwards_compatible` to pro-actively fix issues with the delta_time prevision
         if make_time_backwards_compatible:
-            delta_time_to_use  = self.simulation._delta_time
-            if self.simulation.state._previous_delta_time is not None:
-                delta_time_to_use = self.simulation.state._previous_delta_time
-            if self.simulation.state.current_time - round(self.simulation.state.current_time) < delta_time_to_use:
-                self.simulation.state.current_time = round(self.simulation.state.current_time)
-        while self.simulation.state.current_time + self.simulation._delta_time < end_time:
-            # Invariant: current params are applied at this point
-            inclusive_adjustment = self.simulation._delta_time if inclusive else 0.0
-            if self.next_params_index < len(self._param_set):
-                time, next_params = self._param_set[self.next_params_index]
-                next_stop = min(time, end_time + inclusive_adjustment)
-            else:
-                next_stop = end_time + inclusive_adjustment
-                next_params = None
-
-            yield from self.simulation.iter_run(
-                end_time=next_stop,
-                sampling_interval=sampling_interval,
-                sampling_years=sampling_years,
-            )
-
-            if next_params is not None:
-                self.simulation.reset_current_params(next_params)
-                self.next_params_index += 1
+            delta_time_to_use = simulation._delta_time
+            if simulation.state._previous_delta_time is not None:
+                delta_time_to_use = simulation.state._previous_delta_time
+            if (
+                simulation.state.current_time - round(simulation.state.current_time)
+                < delta_time_to_use
+            ):
+                simulation.state.current_time = round(simulation.state.current_time)
+        # The sampling schedule and progress bar are set up once for the whole run, and
+        # carried across every parameter change.
+        final_end_time = end_time + (simulation._delta_time if inclusive else 0.0)
+        with simulation._prepare_iter(
+            end_time=final_end_time,
+            sampling_interval=sampling_interval,
+            sampling_years=sampling_years,
+        ) as context:
+            while True:
+                # _delta_time is re-read each time round, as the params (and so the time
+                # step) change at every checkpoint
+                delta_time = simulation._delta_time
+                if simulation.state.current_time + delta_time >= end_time:
+                    break
+                # Invariant: current params are applied at this point
+                inclusive_adjustment = delta_time if inclusive else 0.0
+                if self.next_params_index < len(param_set):
+                    time, next_params = param_set[self.next_params_index]
+                    next_stop = min(time, end_time + inclusive_adjustment)
+                else:
+                    next_stop = end_time + inclusive_adjustment
+                    next_params = None
+
+                yield from simulation._step_until(context, next_stop)
+
+                if next_params is not None:
+                    simulation.reset_current_params(next_params)
+                    self.next_params_index += 1
 
     def run(self, *, end_time: float) -> None:
         """Run simulation from current state till `end_time`
@@ -328,17 +537,19 @@ class GenericEndgame(Generic[EndgameModelGeneric, Simulation, State, CombinedPar
         Args:
             end_time (float): end time of the simulation.
         """
-        while self.simulation.state.current_time + self.simulation._delta_time < end_time:
+        simulation = self.simulation
+        param_set = self._param_set
+        while simulation.state.current_time + simulation._delta_time < end_time:
             # Invariant: current params are applied at this point
-            if self.next_params_index < len(self._param_set):
-                time, next_params = self._param_set[self.next_params_index]
+            if self.next_params_index < len(param_set):
+                time, next_params = param_set[self.next_params_index]
                 next_stop = min(time, end_time)
             else:
                 next_stop = end_time
                 next_params = None
 
-            self.simulation.run(end_time=next_stop)
+            simulation.run(end_time=next_stop)
 
             if next_params is not None:
-                self.simulation.reset_current_params(next_params)
+                simulation.reset_current_params(next_params)
                 self.next_params_index += 1
@@ -1,11 +1,17 @@
+import io
+import math
 import warnings
-from abc import ABC, abstractproperty
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
 from typing import ClassVar, Generic, Iterator, TypeVar, cast, overload
 
 import h5py
+import numpy as np
 import tqdm
 from hdf5_dataclass import FileType
-import numpy as np
+from typing_extensions import Self
 
 from endgame_simulations.models import BaseInitialParams
 
@@ -14,12 +20,153 @@ from .common import AdvanceState, BaseState, State
 ParamsModel = TypeVar("ParamsModel", bound=BaseInitialParams)
 
 
+# Tolerance (in steps) used when turning times into step counts, so that floating-point
+# error in e.g. (3.0 - 0.0) / 0.1 == 29.999999999999996 doesn't lose a step.
+_STEP_TOLERANCE = 1e-9
+
+
+# How many steps `GenericSimulation.run` takes between progress bar updates.
+_PROGRESS_STEPS = 1000
+
+
+def _count_steps(start_time: float, end_time: float, delta_time: float) -> int:
+    """
+    The number of whole steps of `delta_time` that fit between `start_time` and `end_time`.
+
+    Args:
+        start_time (float): The time to start stepping from.
+        end_time (float): The time no step may pass.
+        delta_time (float): The time step.
+
+    Returns:
+        int: The number of steps.
+    """
+    return max(math.floor((end_time - start_time) / delta_time + _STEP_TOLERANCE), 0)
+
+
+def _whole_year_steps(
+    start_time: float, delta_time: float, n_steps: int
+) -> list[tuple[int, float]]:
+    """
+    The steps (counting the first as 1) of `n_steps` steps of `delta_time` from
+    `start_time` that land on a whole year, along with that year.
+
+    Args:
+        start_time (float): The time to start stepping from.
+        delta_time (float): The time step.
+        n_steps (int): The number of steps.
+
+    Returns:
+        list[tuple[int, float]]: The step and the year it lands on.
+    """
+    year_steps = []
+    first_year = math.floor(start_time) + 1
+    last_year = math.floor(start_time + n_steps * delta_time + _STEP_TOLERANCE)
+    for year in range(first_year, last_year + 1):
+        steps = (year - start_time) / delta_time
+        step = round(steps)
+        if 1 <= step <= n_steps and abs(steps - step) < _STEP_TOLERANCE:
+            year_steps.append((step, float(year)))
+    return year_steps
+
+
+def _run_loop(
+    state: State,
+    advance_state: AdvanceState,
+    delta_time: float,
+    n_steps: int,
+    debug: bool,
+    snap_to_years: bool = False,
+) -> None:
+    """
+    Advance `state` by `n_steps` steps of `delta_time`.
+
+    This is the bare step loop behind both `GenericSimulation.run` and
+    `GenericSimulation.iter_run`. Everything it touches is passed in as a local, so no
+    attribute or property lookups happen per step.
+
+    Args:
+        state (State): The state to advance (in place).
+        advance_state (AdvanceState): The function used for advancing the state.
+        delta_time (float): The time step.
+        n_steps (int): The number of steps to take.
+        debug (bool): Debug?
+        snap_to_years (bool, optional): Set the time to exactly the year on steps that
+            land on a whole year, as `iter_run` does. Defaults to False.
+    """
+    # crude self-correction at the end of each year to account for floating-point
+    # precision issues: the steps that land on a whole year are worked out up front, and
+    # the time is set to exactly that year on those steps
+    if snap_to_years:
+        year_steps = _whole_year_steps(state.current_time, delta_time, n_steps)
+    else:
+        year_steps = []
+    year_idx = 0
+    next_year_step, next_year = year_steps[0] if year_steps else (-1, 0.0)
+
+    for step in range(1, n_steps + 1):
+        state.current_time += delta_time
+        if step == next_year_step:
+            state.current_time = next_year
+            year_idx += 1
+            if year_idx < len(year_steps):
+                next_year_step, next_year = year_steps[year_idx]
+
+        advance_state(state, debug)
+        state._previous_delta_time = delta_time
+
+
+def _run_one(
+    args: tuple[type["GenericSimulation"], BaseInitialParams, float, float]
+) -> bytes:
+    """
+    Worker for `GenericSimulation.run_many`. This has to live at module level so that
+    the process pool can pickle it.
+
+    Args:
+        args (tuple[type[GenericSimulation], BaseInitialParams, float, float]): The
+            simulation class, its params, the start time and the end time.
+
+    Returns:
+        bytes: The finished simulation, saved as an in-memory HDF5 file.
+    """
+    simulation_class, params, start_time, end_time = args
+    simulation = simulation_class(start_time=start_time, params=params)
+    simulation.run(end_time=end_time)
+    buffer = io.BytesIO()
+    with h5py.File(buffer, "w") as h5:
+        simulation.save(h5)
+    return buffer.getvalue()
+
+
+@dataclass
+class IterContext:
+    """
+    The bookkeeping for iterating a simulation, which is kept across calls to
+    `GenericSimulation._step_until`.
+
+    Attributes:
+        sampling_years (np.ndarray): The (sorted) years at which to sample the state.
+        progress_bar (tqdm.tqdm | None): The progress bar, if verbose.
+        sample_idx (int): The index of the next sampling year to be yielded.
+    """
+
+    sampling_years: np.ndarray
+    progress_bar: tqdm.tqdm | None = None
+    sample_idx: int = 0
+
+
 class GenericSimulation(Generic[ParamsModel, State], ABC):
     """
     The Base class for all simulation classes. These represent basic simulations, that are
     simply advanced in time.
+
+    Instance attributes are stored in slots. Subclasses that add none of their own can
+    declare `__slots__ = ()` to drop the instance `__dict__` entirely.
     """
 
+    __slots__ = ("state", "verbose", "debug")
+
     state_class: ClassVar[type[BaseState]]
     advance_state: ClassVar[AdvanceState]
     state: State
@@ -102,8 +249,13 @@ class GenericSimulation(Generic[ParamsModel, State], ABC):
         self.verbose = verbose
         self.debug = debug
 
-    @abstractproperty
+    @property
+    @abstractmethod
     def _delta_time(self) -> float:
+        """
+        The time step of the simulation. This may depend on the current parameters, so it
+        is read once at the start of every `run`/`iter_run` call, never per step.
+        """
         ...
 
     def get_current_params(self) -> ParamsModel:
@@ -140,6 +292,60 @@ class GenericSimulation(Generic[ParamsModel, State], ABC):
         """
         return cls(input=input)
 
+    @classmethod
+    def run_many(
+        cls,
+        param_list: list[ParamsModel],
+        *,
+        end_time: float,
+        start_time: float = 0.0,
+        max_workers: int | None = None,
+        chunksize: int = 1,
+    ) -> list[Self]:
+        """Run an independent simulation for each set of parameters in `param_list`, in
+        parallel across processes.
+
+        Processes are used rather than threads because `advance_state` is ordinary Python
+        that holds the GIL for most of each step, so threads would effectively run the
+        simulations one at a time.
+
+        Each simulation is created, run and saved in a worker process, then restored here.
+        The simulation class (and its state and advance function) must therefore be
+        picklable, i.e. defined at the top level of an importable module.
+
+        Examples:
+            >>> simulations = Simulation.run_many(
+            ...     [Params(seed=seed) for seed in range(10)], end_time=20
+            ... )
+
+        Args:
+            param_list (list[ParamsModel]): A set of parameters for each simulation.
+            end_time (float): end time of the simulations.
+            start_time (float, optional): Start time of the simulations. Defaults to 0.0.
+            max_workers (int | None, optional): The number of worker processes. Defaults to
+                None, which lets `ProcessPoolExecutor` choose.
+            chunksize (int, optional): How many simulations are sent to a worker at once.
+                For many short simulations, a larger value cuts the per-task overhead of
+                the process pool. Defaults to 1.
+
+        Returns:
+            list[Self]: The finished simulations, in the order of `param_list`.
+        """
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    _run_one,
+                    [(cls, params, start_time, end_time) for params in param_list],
+                    chunksize=chunksize,
+                )
+            )
+
+        simulations = []
+        for result in results:
+            with h5py.File(io.BytesIO(result), "r") as h5:
+                simulations.append(cls.restore(h5))
+        return simulations
+
     @overload
     def iter_run(
         self, *, end_time: float, sampling_interval: float, inclusive: bool = False
@@ -220,42 +426,127 @@ class GenericSimulation(Generic[ParamsModel, State], ABC):
                 f"End time {real_end_time} before start {self.state.current_time}"
             )
 
+        with self._prepare_iter(
+            end_time=real_end_time,
+            sampling_interval=sampling_interval,
+            sampling_years=sampling_years,
+        ) as context:
+            yield from self._step_until(context, real_end_time)
+
+    @contextmanager
+    def _prepare_iter(
+        self,
+        *,
+        end_time: float,
+        sampling_interval: float | None = None,
+        sampling_years: list[float] | None = None,
+    ) -> Iterator[IterContext]:
+        """Set up the sampling schedule and progress bar for iterating the simulation
+        until `end_time`. The context can be passed to any number of `_step_until` calls
+        (e.g. one per parameter change), and the progress bar is closed on exit.
+
+        Args:
+            end_time (float): end time
+            sampling_interval (float | None, optional): State sampling interval (years),
+                counted from the current time. Defaults to None.
+            sampling_years (list[float] | None, optional): list of years to sample State.
+                Defaults to None.
+
+        Yields:
+            Iterator[IterContext]: The iteration context.
+        """
         if sampling_interval and sampling_years:
             raise ValueError(
                 "You must provide sampling_interval, sampling_years or neither"
             )
 
-        if sampling_years:
-            sampling_years = sorted(sampling_years)
-
         if sampling_interval is not None:
-            sampling_years = np.arange(self.state.current_time, real_end_time, sampling_interval)
-
-        sampling_years_idx = 0
-
-        with tqdm.tqdm(
-            total=real_end_time - self.state.current_time + self._delta_time,
-            disable=not self.verbose,
-        ) as progress_bar:
-            while self.state.current_time + self._delta_time <= real_end_time:
-                is_on_sampling_year = (
-                    sampling_years is not None
-                    and sampling_years_idx < len(sampling_years)
-                    and self.state.current_time - sampling_years[sampling_years_idx]
-                    >= 0
-                )
-                if is_on_sampling_year:
-                    yield self.state
-                    sampling_years_idx += 1
+            sampling_years_arr = np.arange(
+                self.state.current_time, end_time, sampling_interval
+            )
+        else:
+            sampling_years_arr = np.sort(
+                np.asarray(sampling_years or [], dtype=np.float64)
+            )
 
-                self.state.current_time += self._delta_time
-                # crude self-correction at the end of each year to account for floating-point precision issues
-                if round(self.state.current_time, 9) % 1 == 0:
-                    self.state.current_time = round(self.state.current_time, 9)
+        if self.verbose:
+            progress_context = tqdm.tqdm(
+                total=end_time - self.state.current_time + self._delta_time
+            )
+        else:
+            progress_context = nullcontext()
 
-                progress_bar.update(self._delta_time)
-                type(self).advance_state(self.state, self.debug)
-                self.state._previous_delta_time = self._delta_time
+        with progress_context as progress_bar:
+            yield IterContext(
+                sampling_years=sampling_years_arr, progress_bar=progress_bar
+            )
+
+    def _step_until(self, context: IterContext, end_time: float) -> Iterator[State]:
+        """Advance the simulation until `end_time`, yielding the state at each of the
+        context's sampling years that falls before it.
+
+        Args:
+            context (IterContext): The iteration context, from `_prepare_iter`.
+            end_time (float): end time
+
+        Yields:
+            Iterator[State]: Iterator of the simulation's state.
+        """
+        # hoisted into locals, as these are otherwise looked up on every step
+        state = self.state
+        delta_time = self._delta_time
+        advance_state = type(self).advance_state
+        debug = self.debug
+        progress_bar = context.progress_bar
+
+        # Sampling is decided on the integer step count rather than on the (drifting)
+        # floating-point current time.
+        n_steps = _count_steps(state.current_time, end_time, delta_time)
+
+        if context.sample_idx == len(context.sampling_years):
+            # nothing left to sample, so this is just a run
+            _run_loop(
+                state, advance_state, delta_time, n_steps, debug, snap_to_years=True
+            )
+            if progress_bar is not None:
+                progress_bar.update(n_steps * delta_time)
+            return
+
+        # The remaining sampling years up to `end_time`, as step indices from here.
+        sampling_years = context.sampling_years[
+            context.sample_idx : np.searchsorted(
+                context.sampling_years, end_time, side="right"
+            )
+        ]
+        steps = np.ceil(
+            (sampling_years - state.current_time) / delta_time - _STEP_TOLERANCE
+        ).astype(np.int64)
+        steps = np.maximum(steps, 0)
+        # at most one sample is taken per step, so samples that share a step (or lie in
+        # the past) are taken on the steps that follow
+        offsets = np.arange(len(steps))
+        steps = np.maximum.accumulate(steps - offsets) + offsets
+        # any that don't fit before `end_time` are left for a later call
+        sample_steps: list[int] = steps[: np.searchsorted(steps, n_steps)].tolist()
+
+        # The steps between two samples are run without any sampling or progress
+        # checks, which are only done once per stretch.
+        step = 0
+        for stop_step in sample_steps + [n_steps]:
+            _run_loop(
+                state,
+                advance_state,
+                delta_time,
+                stop_step - step,
+                debug,
+                snap_to_years=True,
+            )
+            if progress_bar is not None:
+                progress_bar.update((stop_step - step) * delta_time)
+            step = stop_step
+            if step < n_steps:
+                yield state
+                context.sample_idx += 1
 
     def run(self, *, end_time: float) -> None:
         """Run simulation from current state till `end_time`
@@ -268,17 +559,23 @@ class GenericSimulation(Generic[ParamsModel, State], ABC):
                 f"End time {end_time} before start {self.state.current_time}"
             )
 
+        state = self.state
+        delta_time = self._delta_time
+        advance_state = type(self).advance_state
+        debug = self.debug
+
+        n_steps = _count_steps(state.current_time, end_time, delta_time)
+        if not self.verbose:
+            _run_loop(state, advance_state, delta_time, n_steps, debug)
+            return
+
         # total progress bar must be a bit over so that the loop doesn't exceed total
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", category=tqdm.TqdmWarning)
             with tqdm.tqdm(
-                total=end_time - self.state.current_time + self._delta_time,
-                disable=not self.verbose,
+                total=end_time - state.current_time + delta_time
             ) as progress_bar:
-
-                while self.state.current_time + self._delta_time <= end_time:
-                    self.state.current_time += self._delta_time
-                    progress_bar.update(self._delta_time)
-                    type(self).advance_state(self.state, self.debug)
-                    self.state._previous_delta_time = self._delta_time
-                    
+                for first_step in range(0, n_steps, _PROGRESS_STEPS):
+                    batch_steps = min(_PROGRESS_STEPS, n_steps - first_step)
+                    _run_loop(state, advance_state, delta_time, batch_steps, debug)
+                    progress_bar.update(batch_steps * delta_time)
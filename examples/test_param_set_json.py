@@ -0,0 +1,52 @@
+import io
+import math
+
+import h5py
+
+from endgame_simulations.endgame_simulation import (
+    _encode_param_set,
+    _read_param_set,
+    _write_param_set,
+    orjson,
+)
+from endgame_simulations.models import BaseInitialParams
+
+# This example checks that endgame param sets survive being written to and read back from
+# HDF5, including values that orjson (used when installed) can't handle on its own.
+
+
+class Params(BaseInitialParams):
+    rates: dict[int, float] = {}
+    population: int = 0
+    delta_time: float = 0.1
+
+
+def round_trip(params: Params) -> Params:
+    buffer = io.BytesIO()
+    with h5py.File(buffer, "w") as h5:
+        _write_param_set(h5, _encode_param_set([(0.0, params)]))
+    with h5py.File(buffer, "r") as h5:
+        [(time, restored)] = _read_param_set(h5, Params)
+    assert time == 0.0, time
+    return restored
+
+
+print("orjson installed:", orjson is not None)
+
+# dicts with non-str keys
+params = Params(rates={1: 0.5, 20: 0.25})
+assert round_trip(params) == params, round_trip(params)
+
+# ints beyond 64 bits, which must not come back as floats
+params = Params(population=2**70)
+assert round_trip(params).population == 2**70, round_trip(params).population
+params = Params(population=-(2**63) - 1)
+assert round_trip(params).population == -(2**63) - 1, round_trip(params).population
+
+# NaN and infinity
+params = Params(rates={1: math.nan}, delta_time=math.inf)
+restored = round_trip(params)
+assert math.isnan(restored.rates[1]), restored.rates
+assert restored.delta_time == math.inf, restored.delta_time
+
+print("All param set JSON checks passed")
@@ -0,0 +1,76 @@
+from hdf5_dataclass import HDF5Dataclass
+
+from endgame_simulations.models import BaseInitialParams
+from endgame_simulations.simulations import BaseState, GenericSimulation
+
+# This example checks running many independent simulations in parallel, with
+# `run_many`. Each simulation runs in a worker process, so everything it needs must be
+# defined at the top level of a module (as here), and the checks themselves must sit
+# under `if __name__ == "__main__"` so that worker processes don't run them again.
+
+
+class Params(BaseInitialParams):
+    increment: int = 1
+    delta_time: float = 0.5
+
+
+class State(HDF5Dataclass, BaseState[Params]):
+    current_time: float
+    params: Params
+    total: int = 0
+
+    @classmethod
+    def from_params(cls, params: Params, current_time):
+        return cls(params=params, current_time=current_time)
+
+    def get_params(self) -> Params:
+        return self.params
+
+    def reset_params(self, params: Params):
+        self.params = params
+
+
+# Adds the increment every step, so each simulation's result identifies its params.
+def advance_state(state: State, debug: bool = False):
+    state.total += state.params.increment
+
+
+class Sim(
+    GenericSimulation[Params, State], state_class=State, advance_state=advance_state
+):
+    @property
+    def _delta_time(self) -> float:
+        return self.state.params.delta_time
+
+
+if __name__ == "__main__":
+    # results come back in the order of the params, restored from the workers
+    param_list = [Params(increment=increment) for increment in range(6)]
+    simulations = Sim.run_many(param_list, end_time=5, start_time=1, max_workers=2)
+    assert [sim.state.total for sim in simulations] == [8 * i for i in range(6)]
+    for params, sim in zip(param_list, simulations):
+        assert isinstance(sim, Sim), sim
+        assert sim.state.params == params, sim.state.params
+        assert sim.state.current_time == 5.0, sim.state.current_time
+
+    # they match the same simulations run one at a time
+    for params, sim in zip(param_list, simulations):
+        serial_sim = Sim(start_time=1, params=params)
+        serial_sim.run(end_time=5)
+        assert serial_sim.state == sim.state, (serial_sim.state, sim.state)
+
+    # sending several simulations to a worker at once (including a final, shorter chunk)
+    # gives the same results, in the same order
+    for chunksize in [2, 4, 10]:
+        chunked = Sim.run_many(
+            param_list, end_time=5, start_time=1, max_workers=2, chunksize=chunksize
+        )
+        assert [sim.state for sim in chunked] == [sim.state for sim in simulations], (
+            chunksize,
+            [sim.state.total for sim in chunked],
+        )
+
+    # no params, no simulations
+    assert Sim.run_many([], end_time=5) == []
+
+    print("All run_many checks passed")
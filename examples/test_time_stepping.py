@@ -0,0 +1,131 @@
+from typing import Optional
+
+from hdf5_dataclass import HDF5Dataclass
+
+from endgame_simulations.endgame_simulation import GenericEndgame
+from endgame_simulations.models import (
+    BaseInitialParams,
+    BaseProgramParams,
+    EndgameModel,
+    make_endgame_model,
+)
+from endgame_simulations.simulations import BaseState, GenericSimulation
+
+# This example checks how simulations (and endgame simulations) step through time: that
+# they stop exactly at the end time, and which states are yielded when sampling.
+# Floating-point error used to make these drift (e.g. running from 0 to 3 in steps of 0.1
+# stopped at 2.9).
+
+
+class Params(BaseInitialParams):
+    delta_time: float = 0.1
+
+
+class State(HDF5Dataclass, BaseState[Params]):
+    current_time: float
+    params: Params
+    _previous_delta_time: Optional[float] = None
+    n_steps: int = 0
+
+    @classmethod
+    def from_params(cls, params: Params, current_time):
+        return cls(params=params, current_time=current_time)
+
+    def get_params(self) -> Params:
+        return self.params
+
+    def reset_params(self, params: Params):
+        self.params = params
+
+
+# Counts the steps taken, so we can check none were lost.
+def advance_state(state: State, debug: bool = False):
+    state.n_steps += 1
+
+
+class Sim(
+    GenericSimulation[Params, State], state_class=State, advance_state=advance_state
+):
+    @property
+    def _delta_time(self) -> float:
+        return self.state.params.delta_time
+
+
+def sampled_times(states) -> list[float]:
+    return [round(state.current_time, 9) for state in states]
+
+
+# run stops at the end time (up to floating-point error, as run doesn't snap to years)
+sim = Sim(start_time=0, params=Params(delta_time=0.1))
+sim.run(end_time=3)
+assert round(sim.state.current_time, 9) == 3.0, sim.state.current_time
+assert sim.state.n_steps == 30, sim.state.n_steps
+
+sim = Sim(start_time=1, params=Params(delta_time=1 / 12))
+sim.run(end_time=11)
+assert round(sim.state.current_time, 9) == 11.0, sim.state.current_time
+assert sim.state.n_steps == 120, sim.state.n_steps
+
+# iter_run samples every interval, up to (but not including) the end time, and sets the
+# time to exactly the year on steps that land on a whole year
+sim = Sim(start_time=0, params=Params(delta_time=0.1))
+times = sampled_times(sim.iter_run(end_time=3, sampling_interval=0.5))
+assert times == [0.0, 0.5, 1.0, 1.5, 2.0, 2.5], times
+assert sim.state.current_time == 3.0, sim.state.current_time
+
+# with inclusive, the end time itself is sampled too
+sim = Sim(start_time=0, params=Params(delta_time=0.1))
+times = sampled_times(sim.iter_run(end_time=3, sampling_interval=1.0, inclusive=True))
+assert times == [0.0, 1.0, 2.0, 3.0], times
+
+# sampling years are sorted, taken on the first step at or after each year, and at most
+# one sample is taken per step (so a repeated year is sampled on the following step)
+sim = Sim(start_time=0, params=Params(delta_time=0.1))
+times = sampled_times(sim.iter_run(end_time=3, sampling_years=[2.5, 0.35, 1.0, 1.0]))
+assert times == [0.4, 1.0, 1.1, 2.5], times
+
+
+# An endgame simulation whose time step changes at each parameter change.
+TestEndgame = make_endgame_model("TestEndgame", Params, BaseProgramParams)
+endgame = TestEndgame.parse_obj(
+    {"parameters": {"initial": {}, "changes": []}, "programs": []}
+)
+
+
+def convert_endgame(endgame: EndgameModel) -> list[tuple[float, Params]]:
+    return [
+        (0.0, Params(delta_time=0.25)),
+        (2.0, Params(delta_time=0.1)),
+        (3.5, Params(delta_time=0.5)),
+    ]
+
+
+class Endgame(
+    GenericEndgame[TestEndgame, Sim, State, Params],
+    convert_endgame=convert_endgame,
+    simulation_class=Sim,
+    combined_params_model=Params,
+):
+    pass
+
+
+# run stops at the end time, across the parameter changes
+sim = Endgame(start_time=0, endgame=endgame)
+sim.run(end_time=5)
+assert (
+    round(sim.simulation.state.current_time, 9) == 5.0
+), sim.simulation.state.current_time
+assert sim.simulation.state.n_steps == 26, sim.simulation.state.n_steps
+
+# the sampling interval is counted from the start, not restarted at each change
+sim = Endgame(start_time=0, endgame=endgame)
+times = sampled_times(sim.iter_run(end_time=5, sampling_interval=1.0))
+assert times == [0.0, 1.0, 2.0, 3.0, 4.0], times
+assert sim.simulation.state.current_time == 5.0, sim.simulation.state.current_time
+
+# each sampling year is yielded once, even though it lies before later changes
+sim = Endgame(start_time=0, endgame=endgame)
+times = sampled_times(sim.iter_run(end_time=5, sampling_years=[1.0, 3.0, 4.5]))
+assert times == [1.0, 3.0, 4.5], times
+
+print("All time stepping checks passed")